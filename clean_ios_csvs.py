@@ -1,11 +1,21 @@
 import pandas as pd
 from pathlib import Path
 
+# pyarrow's CSV writer is multi-threaded C++; pandas' to_csv is the fallback
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except ImportError:
+    pa = pacsv = None
+
 FILES = [
     "IOS_Tenant_Targets.csv",
     "IOS_Tenant_Targets_Wth_Coords.csv",
 ]
 
+# Rows per chunk, so memory stays flat however big the file gets
+CHUNK_ROWS = 50_000
+
 COLUMNS_TO_DROP = {
     "Ownership",
     "Contact",
@@ -18,14 +28,39 @@ COLUMNS_TO_DROP = {
 def clean_csv(path: Path):
     print(f"Cleaning {path.name}...")
 
-    df = pd.read_csv(path, encoding="latin1")
+    # Read just the header, then parse only the columns we keep
+    header = pd.read_csv(path, encoding="latin1", nrows=0).columns
 
     # Drop columns only if they exist (safe for both files)
-    existing = [c for c in COLUMNS_TO_DROP if c in df.columns]
-    df = df.drop(columns=existing)
+    existing = [c for c in header if c in COLUMNS_TO_DROP]
+    keep = [c for c in header if c not in COLUMNS_TO_DROP]
+
+    # Stream the file through in chunks instead of holding it all in memory.
+    # dtype=str: per-chunk type inference could otherwise format the same
+    # column differently from one chunk to the next (1 vs 1.0)
+    chunks = pd.read_csv(
+        path,
+        encoding="latin1",
+        usecols=keep,
+        dtype=str,
+        chunksize=CHUNK_ROWS,
+    )
 
     output_path = path.with_stem(f"{path.stem}_cleaned")
-    df.to_csv(output_path, index=False)
+    if pacsv is not None:
+        # Every column is text, so the schema is known before any chunk
+        schema = pa.schema([(c, pa.string()) for c in keep])
+        options = pacsv.WriteOptions(batch_size=CHUNK_ROWS)
+        with pacsv.CSVWriter(str(output_path), schema, write_options=options) as writer:
+            for chunk in chunks:
+                writer.write_table(
+                    pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+                )
+    else:
+        with open(output_path, "w", encoding="utf-8", newline="") as out:
+            pd.DataFrame(columns=keep).to_csv(out, index=False)
+            for chunk in chunks:
+                chunk.to_csv(out, index=False, header=False)
 
     print(f" → Wrote {output_path.name} ({len(existing)} columns removed)")
 
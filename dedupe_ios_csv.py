@@ -5,13 +5,18 @@ from pathlib import Path
 CSV_PATH = "IOS_Tenant_Targets_cleaned.csv"
 
 
-def normalize_text(s: str) -> str:
-    if s is None:
-        return ""
-    s = str(s).lower().strip()
-    s = re.sub(r"[^\w\s]", "", s)   # remove punctuation
-    s = re.sub(r"\s+", " ", s)      # collapse whitespace
-    return s
+_PUNCT_RE = re.compile(r"[^\w\s]")
+_WS_RE = re.compile(r"\s+")
+
+
+def normalize_text(s: pd.Series) -> pd.Series:
+    return (
+        s.fillna("").astype(str)
+        .str.lower()
+        .str.strip()
+        .str.replace(_PUNCT_RE, "", regex=True)   # remove punctuation
+        .str.replace(_WS_RE, " ", regex=True)     # collapse whitespace
+    )
 
 
 def load_with_real_header(path: Path) -> pd.DataFrame:
@@ -20,13 +25,17 @@ def load_with_real_header(path: Path) -> pd.DataFrame:
     and the real header is on the next row.
     This loads using the 2nd row as the header.
     """
-    # Read first line to detect the junk header
-    first_line = path.read_text(encoding="latin1", errors="ignore").splitlines()[0]
-    if first_line.lower().startswith("unnamed: 0"):
-        # Use the second row as header
-        return pd.read_csv(path, encoding="latin1", header=1)
-    else:
-        return pd.read_csv(path, encoding="latin1")
+    with path.open("rb") as f:
+        # Peek at just the first line to detect the junk header
+        first_line = f.readline().decode("latin1", errors="ignore")
+        f.seek(0)
+
+        # Use the second row as header if the first one is junk. Default
+        # parser on purpose: unlike the pyarrow engine it renames blank and
+        # repeated header cells (Unnamed: 5, Notes.1), which keeps the
+        # rewritten file's columns unique
+        header = 1 if first_line.lower().startswith("unnamed: 0") else 0
+        return pd.read_csv(f, encoding="latin1", header=header)
 
 
 def main():
@@ -45,17 +54,19 @@ def main():
         print("Available columns:", list(df.columns))
         raise ValueError(f"Missing required columns: {missing}")
 
-    # Dedupe on Address + State only
-    df["_dedupe_key"] = (
-        df["Address"].apply(normalize_text) + "|" +
-        df["State"].apply(normalize_text)
-    )
+    # Dedupe on Address + State only (normalized keys stay off df)
+    keys = pd.DataFrame({
+        "address": normalize_text(df["Address"]),
+        "state": normalize_text(df["State"]),
+    })
 
     before = len(df)
-    df = df.drop_duplicates(subset="_dedupe_key", keep="first").drop(columns="_dedupe_key")
+    df = df.loc[~keys.duplicated(keep="first")]
     after = len(df)
 
-    # Overwrite same file (no extra junk header row gets re-written)
+    # Overwrite same file (no extra junk header row gets re-written).
+    # Plain to_csv on purpose: this is a hand-edited input, and pyarrow would
+    # re-quote every string and reformat values (True -> true, 7.0 -> 7)
     df.to_csv(path, index=False)
 
     print("Deduplication complete.")
@@ -1,93 +1,163 @@
+import json
 import os
 import re
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
+from geopy.adapters import RequestsAdapter
 from geopy.geocoders import Nominatim
 from geopy.extra.rate_limiter import RateLimiter
 from geopy.exc import GeocoderUnavailable, GeocoderTimedOut
 import folium
+from folium.plugins import FastMarkerCluster
+
+# Optional: pyarrow gives us multi-threaded CSV reading and writing
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    CSV_ENGINE = "pyarrow"
+except ImportError:
+    pa = pacsv = None
+    CSV_ENGINE = "c"
+
+# Optional: ftfy for thorough mojibake repair (see _fix_mojibake)
+try:
+    import ftfy
+except ImportError:
+    ftfy = None
 
 # ========= CONFIG =========
 # Point these at your cleaned files
 CSV_PATH = "IOS_Tenant_Targets_cleaned.csv"
 OUTPUT_CSV_WITH_COORDS = "IOS_Tenant_Targets_Wth_Coords_cleaned.csv"
 OUTPUT_MAP_HTML = "index.html"
+# Concurrent geocode requests; RateLimiter still enforces 1 req/s overall
+GEOCODE_WORKERS = 5
+# Every successful geocode is checkpointed here so reruns skip it
+GEOCODE_CACHE_DB = "geocode_cache.sqlite"
+GEOCODE_CACHE_COMMIT_EVERY = 25
 # ==========================
 
 
-def fix_encoding(s: str):
+# Common mojibake sequences that often survive the latin1 -> utf8 roundtrip
+MOJIBAKE_REPLACEMENTS = {
+    "Ã¢ÂÂ": "-",   # broken non-breaking hyphen
+    "â": "-",     # another broken hyphen form
+    "\u2011": "-",  # real non-breaking hyphen (U+2011)
+    "–": "-",       # en dash
+    "—": "-",       # em dash
+    "Ã¢ÂÂ": "'",   # broken apostrophe
+    "â": "'",     # broken apostrophe form
+    "’": "'",       # smart apostrophe
+}
+
+# Single alternation so each string is scanned once, not once per entry.
+# Longest first, so no sequence is shadowed by a shorter prefix.
+_MOJIBAKE_RE = re.compile(
+    "|".join(map(re.escape, sorted(MOJIBAKE_REPLACEMENTS, key=len, reverse=True)))
+)
+
+# Suite/unit fragments and cleanup patterns used by strip_suite
+_SUITE_RE = re.compile(
+    r",\s*(Suite|Ste\.?|Unit|Bldg\.?|Building)\b[^,]*",
+    flags=re.IGNORECASE,
+)
+_HASH_RE = re.compile(r"#\s*\w+")
+_MULTISPACE_RE = re.compile(r"\s{2,}")
+_TRAILING_SEP_RE = re.compile(r"[,\s]+$")
+
+_NON_ASCII_RE = re.compile(r"[^\x00-\x7f]")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+# Tenant lists repeat the same City/State/Location strings a lot, so
+# memoize the one step that still runs per cell in Python
+@lru_cache(maxsize=200_000)
+def _fix_mojibake(s: str) -> str:
+    # ftfy knows far more mojibake patterns than a single roundtrip
+    if ftfy is not None:
+        return ftfy.fix_text(s)
+
+    # latin1 -> utf8 roundtrip (your original approach); keep s if it fails
+    try:
+        return s.encode("latin1").decode("utf8")
+    except UnicodeError:
+        return s
+
+
+def fix_encoding(s: pd.Series) -> pd.Series:
     """
     Fix common mojibake and normalize punctuation for geocoding.
     Handles things like:
       - USÃ¢ÂÂ19  -> US-19
       - LeeÃ¢ÂÂs  -> Lee's
     """
-    if not isinstance(s, str):
-        return s
-
-    # First attempt: latin1 -> utf8 roundtrip (your original approach)
-    try:
-        s2 = s.encode("latin1").decode("utf8")
-        s = s2
-    except Exception:
-        pass
+    # First attempt: ftfy (or a latin1 -> utf8 roundtrip). Mojibake is never
+    # pure ASCII, so only the (few) non-ASCII cells go through Python.
+    non_ascii = s.str.contains(_NON_ASCII_RE, na=False)
+    if non_ascii.any():
+        s = s.mask(non_ascii, s[non_ascii].map(_fix_mojibake))
 
     # Then normalize common mojibake sequences that often survive the roundtrip
-    replacements = {
-        "Ã¢ÂÂ": "-",   # broken non-breaking hyphen
-        "â": "-",     # another broken hyphen form
-        "-": "-",       # real non-breaking hyphen (U+2011)
-        "–": "-",       # en dash
-        "—": "-",       # em dash
-        "Ã¢ÂÂ": "'",   # broken apostrophe
-        "â": "'",     # broken apostrophe form
-        "’": "'",       # smart apostrophe
-    }
-    for bad, good in replacements.items():
-        s = s.replace(bad, good)
+    s = s.str.replace(
+        _MOJIBAKE_RE,
+        lambda m: MOJIBAKE_REPLACEMENTS[m.group(0)],
+        regex=True,
+    )
 
     # Collapse weird whitespace
-    s = " ".join(s.split())
-    return s
+    return s.str.replace(_WHITESPACE_RE, " ", regex=True).str.strip()
 
 
-def strip_suite(addr: str) -> str:
+def strip_suite(addr: pd.Series) -> pd.Series:
     """
     Remove suite/unit/building fragments that often break geocoding:
     ", Suite 708", ", Ste B", ", Unit A", ", Bldg 10", ", Building 202"
     Also removes trailing '#' fragments like "#101".
     Only used for geocoding; original Address is kept for display.
     """
-    if not isinstance(addr, str):
-        return addr
-
     # First fix encoding on the raw address, so our patterns see real characters
     addr = fix_encoding(addr)
 
     # Remove comma + Suite/Ste/Unit/Bldg/Building up to the next comma (or end)
-    addr = re.sub(
-        r",\s*(Suite|Ste\.?|Unit|Bldg\.?|Building)\b[^,]*",
-        "",
-        addr,
-        flags=re.IGNORECASE,
-    )
+    addr = addr.str.replace(_SUITE_RE, "", regex=True)
 
     # Remove inline "#" fragments (e.g. "#101")
-    addr = re.sub(r"#\s*\w+", "", addr)
+    addr = addr.str.replace(_HASH_RE, "", regex=True)
 
     # Collapse consecutive spaces
-    addr = re.sub(r"\s{2,}", " ", addr).strip()
+    addr = addr.str.replace(_MULTISPACE_RE, " ", regex=True).str.strip()
 
     # Strip any trailing commas/spaces
-    addr = re.sub(r"[,\s]+$", "", addr)
+    addr = addr.str.replace(_TRAILING_SEP_RE, "", regex=True)
 
     return addr
 
 
+def write_csv(df: pd.DataFrame, path: str) -> None:
+    """
+    Write df (without its index) to path, via pyarrow when it's installed.
+    """
+    if pacsv is None:
+        df.to_csv(path, index=False)
+        return
+
+    options = pacsv.WriteOptions(batch_size=50_000)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    pacsv.write_csv(table, path, write_options=options)
+
+
 def load_and_clean(csv_path: str) -> pd.DataFrame:
     # Read with a forgiving encoding
-    df = pd.read_csv(csv_path, encoding="latin1")
+    df = pd.read_csv(csv_path, encoding="latin1", engine=CSV_ENGINE)
+    # The pyarrow engine (pandas < 3) gives None for empty text cells; make
+    # them NaN like the C parser so the str() cleanup below is unchanged
+    df = df.fillna(np.nan)
 
     # If the first row looks like headers (Tenant, Location, etc.), fix that
     first_row_values = [str(v).strip() for v in df.iloc[0].tolist()]
@@ -106,10 +176,10 @@ def load_and_clean(csv_path: str) -> pd.DataFrame:
 
     # Basic cleanup + encoding fix on key fields
     for col in EXPECTED_COLS:
-        df[col] = df[col].astype(str).str.strip().apply(fix_encoding)
+        df[col] = fix_encoding(df[col].astype(str).str.strip())
 
     # Build a CLEAN address string just for geocoding
-    df["clean_address"] = df["Address"].apply(strip_suite)
+    df["clean_address"] = strip_suite(df["Address"])
 
     # full_address used for geocoding (append country to help Nominatim)
     df["full_address"] = (
@@ -118,18 +188,54 @@ def load_and_clean(csv_path: str) -> pd.DataFrame:
         df["State"] + ", USA"
     )
 
+    # Few distinct tenants/states: categories make grouping work on small
+    # int codes (done last, as categoricals don't support "+" above)
+    df["Tenant"] = df["Tenant"].astype("category")
+    df["State"] = df["State"].astype("category")
+
     return df
 
 
+def open_geocode_cache(db_path: str) -> sqlite3.Connection:
+    """
+    Open (creating if needed) the sqlite geocode cache keyed by full_address.
+    """
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS geo ("
+        "addr TEXT PRIMARY KEY, lat REAL, lon REAL, ts INTEGER)"
+    )
+    return conn
+
+
+def load_geocode_cache(conn: sqlite3.Connection) -> dict:
+    """
+    Read every cached coordinate into dict[full_address] -> (lat, lon).
+    """
+    rows = conn.execute(
+        "SELECT addr, lat, lon FROM geo WHERE lat IS NOT NULL AND lon IS NOT NULL"
+    )
+    return {addr: (lat, lon) for addr, lat, lon in rows}
+
+
 def geocode_addresses(
     df: pd.DataFrame,
-    existing_cache: dict | None = None
+    existing_cache: dict | None = None,
+    cache_db: sqlite3.Connection | None = None,
 ) -> pd.DataFrame:
     """
     Geocode all addresses in df["full_address"].
     existing_cache: dict[full_address] -> (lat, lon)
+    cache_db: optional sqlite cache (see open_geocode_cache); new successful
+    results are written to it as they arrive, so a crash loses little work.
     """
-    geolocator = Nominatim(user_agent="ios_tenant_mapper", timeout=15)
+    # One geocoder (and so one pooled requests.Session) serves the whole
+    # batch, keeping TCP/TLS connections to Nominatim alive between calls.
+    geolocator = Nominatim(
+        user_agent="ios_tenant_mapper",
+        timeout=15,
+        adapter_factory=RequestsAdapter,
+    )
 
     geocode = RateLimiter(
         geolocator.geocode,
@@ -167,22 +273,52 @@ def geocode_addresses(
         cache[addr] = result
         return result
 
-    lats = []
-    lons = []
-
-    print("Geocoding addresses...")
-    total = len(df)
-    for i, addr in enumerate(df["full_address"], start=1):
-        lat, lon = geocode_one(addr)
-        lats.append(lat)
-        lons.append(lon)
+    # Geocode each distinct address once; duplicates and cached rows are
+    # filled in from the cache afterwards.
+    keys = df["full_address"].fillna("").astype(str).str.strip()
+    pending = [addr for addr in keys.drop_duplicates() if addr and addr not in cache]
+    total = len(pending)
 
-        # Only spam the console occasionally
-        if i == 1 or i == total or i % 10 == 0:
-            print(f"[{i}/{total}] {addr} -> ({lat}, {lon})")
+    print(f"Geocoding {total} new addresses ({len(keys)} rows)...")
 
-    df["lat"] = lats
-    df["lon"] = lons
+    # RateLimiter is thread-safe: workers share its request slots, so the
+    # pool only overlaps network latency and never exceeds the OSM rate.
+    # Leaving the geolocator's context closes its pooled connections.
+    pool = ThreadPoolExecutor(max_workers=GEOCODE_WORKERS)
+    saved = 0
+    with geolocator:
+        try:
+            results = pool.map(geocode_one, pending)
+            for i, (addr, (lat, lon)) in enumerate(zip(pending, results), start=1):
+                # Written from this thread only: sqlite connections aren't shared.
+                # Misses aren't stored, so they are retried on the next run.
+                if cache_db is not None and lat is not None and lon is not None:
+                    cache_db.execute(
+                        "INSERT OR REPLACE INTO geo (addr, lat, lon, ts) VALUES (?, ?, ?, ?)",
+                        (addr, lat, lon, int(time.time())),
+                    )
+                    saved += 1
+                    if saved % GEOCODE_CACHE_COMMIT_EVERY == 0:
+                        cache_db.commit()
+
+                # Only spam the console occasionally
+                if i == 1 or i == total or i % 10 == 0:
+                    print(f"[{i}/{total}] {addr} -> ({lat}, {lon})")
+        except BaseException:
+            # pool.map queued every address; drop the ones not yet started
+            # so an error or Ctrl-C surfaces now, not after the whole queue
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        finally:
+            # Keep every row written so far, even when we're unwinding
+            if cache_db is not None:
+                cache_db.commit()
+        pool.shutdown()
+
+    coords = keys.map(lambda addr: cache.get(addr, (None, None)))
+    df[["lat", "lon"]] = pd.DataFrame(
+        coords.tolist(), index=df.index, columns=["lat", "lon"]
+    )
 
     # Save failures separately for inspection
     df_failed = df[df["lat"].isna() | df["lon"].isna()].copy()
@@ -193,12 +329,37 @@ def geocode_addresses(
     print(f"Geocoding complete. Kept {after}/{before} rows with valid coordinates.")
     if not df_failed.empty:
         fail_path = "geocode_failures.csv"
-        df_failed.to_csv(fail_path, index=False)
+        write_csv(df_failed, fail_path)
         print(f"{len(df_failed)} rows failed geocoding. Written to {os.path.abspath(fail_path)}")
 
     return df
 
 
+# Columns sent per marker; _MARKER_CALLBACK_JS reads them by position
+MARKER_FIELDS = ["lat", "lon", "Tenant", "Address", "City", "State"]
+
+# Same popup/tooltip/icon folium.Marker used to emit, built client-side.
+# %s is the tenant's marker color (as a JSON string).
+_MARKER_CALLBACK_JS = """
+function (row) {
+    var marker = L.marker(new L.LatLng(row[0], row[1]));
+    marker.setIcon(L.AwesomeMarkers.icon({
+        icon: "info-sign",
+        prefix: "glyphicon",
+        iconColor: "white",
+        markerColor: %s
+    }));
+    marker.bindPopup(
+        "<b>Tenant:</b> " + row[2] + "<br>" +
+        "<b>Address:</b> " + row[3] + ", " + row[4] + ", " + row[5],
+        {maxWidth: 300}
+    );
+    marker.bindTooltip(String(row[2]), {sticky: true});
+    return marker;
+}
+"""
+
+
 def build_map(df: pd.DataFrame, output_html: str):
     # Center map on mean lat/lon
     center_lat = df["lat"].mean()
@@ -215,31 +376,22 @@ def build_map(df: pd.DataFrame, output_html: str):
         "black", "lightgray"
     ]
 
-    tenants = sorted(df["Tenant"].unique())
+    # Split by tenant in one pass (sorted, so colors stay stable)
+    tenant_groups = list(df.groupby("Tenant", sort=True, observed=True))
     color_map = {tenant: color_cycle[i % len(color_cycle)]
-                 for i, tenant in enumerate(tenants)}
-
-    # Create a layer for each tenant
-    for tenant in tenants:
-        tenant_df = df[df["Tenant"] == tenant]
-        fg = folium.FeatureGroup(name=tenant, show=True)
+                 for i, (tenant, _) in enumerate(tenant_groups)}
 
-        for _, row in tenant_df.iterrows():
-            popup_lines = [
-                f"<b>Tenant:</b> {row['Tenant']}",
-                f"<b>Address:</b> {row['Address']}, {row['City']}, {row['State']}",
-            ]
+    # Create a clustered layer for each tenant. Markers are sent to the
+    # browser as one data array and built there by _MARKER_CALLBACK_JS.
+    for tenant, tenant_df in tenant_groups:
+        data = tenant_df[MARKER_FIELDS].to_numpy().tolist()
 
-            popup_html = "<br>".join(popup_lines)
-
-            folium.Marker(
-                location=[row["lat"], row["lon"]],
-                popup=folium.Popup(popup_html, max_width=300),
-                tooltip=row["Tenant"],
-                icon=folium.Icon(color=color_map[tenant])
-            ).add_to(fg)
-
-        fg.add_to(m)
+        FastMarkerCluster(
+            data,
+            callback=_MARKER_CALLBACK_JS % json.dumps(color_map[tenant]),
+            name=tenant,
+            show=True,
+        ).add_to(m)
 
     folium.LayerControl(collapsed=False).add_to(m)
 
@@ -256,7 +408,7 @@ def main():
     coords_path = Path(OUTPUT_CSV_WITH_COORDS)
     if coords_path.exists():
         try:
-            df_cached = pd.read_csv(coords_path, encoding="latin1")
+            df_cached = pd.read_csv(coords_path, encoding="latin1", engine=CSV_ENGINE)
             if {"full_address", "lat", "lon"}.issubset(df_cached.columns):
                 existing_cache = {
                     str(row["full_address"]).strip(): (row["lat"], row["lon"])
@@ -266,10 +418,20 @@ def main():
         except Exception as e:
             print(f"Could not load cache from {coords_path}: {e}")
 
-    df = geocode_addresses(df, existing_cache=existing_cache)
+    # Merge in the incremental sqlite cache (survives interrupted runs)
+    cache_db = open_geocode_cache(GEOCODE_CACHE_DB)
+    try:
+        db_cache = load_geocode_cache(cache_db)
+        if db_cache:
+            existing_cache = {**(existing_cache or {}), **db_cache}
+            print(f"Loaded {len(db_cache)} cached coordinates from {GEOCODE_CACHE_DB}.")
+
+        df = geocode_addresses(df, existing_cache=existing_cache, cache_db=cache_db)
+    finally:
+        cache_db.close()
 
     # Save a copy with coordinates for future reuse (avoid re-geocoding)
-    df.to_csv(OUTPUT_CSV_WITH_COORDS, index=False)
+    write_csv(df, OUTPUT_CSV_WITH_COORDS)
     print(f"CSV with coordinates saved to: {os.path.abspath(OUTPUT_CSV_WITH_COORDS)}")
 
     build_map(df, OUTPUT_MAP_HTML)